@@ -5,6 +5,7 @@ Thind accretion disk with a simple linear model of spectrum
 @author: Alexis Larrañaga - 2023
 ===============================================================================
 """
+from numpy import where
 
 class structure:
     def __init__(self, blackhole, R_min=False , R_max=20., corotating=True):
@@ -17,18 +18,26 @@ class structure:
                 self.in_edge = blackhole.ISCOcounter
         
         self.out_edge = R_max
+        # Slope of the linear spectrum
+        self.m = (1.-0.)/(self.in_edge - self.out_edge)
 
     def intensity(self, r):
         '''
         Linear model of the spectrum of the accretion disk
         '''
-        m = (1.-0.)/(self.in_edge - self.out_edge)
-        I = m * (r - self.out_edge)
         if r>self.in_edge and r<self.out_edge:
-            return I
+            return self.m * (r - self.out_edge)
         else:
             return 0.
 
+    def intensity_batch(self, r):
+        '''
+        Linear model of the spectrum for an array of radii (including the 
+        edges of the disk)
+        '''
+        inside = (r >= self.in_edge) & (r <= self.out_edge)
+        return where(inside, self.m * (r - self.out_edge), 0.)
+
 
 
 ###############################################################################
@@ -6,7 +6,7 @@ emitted from the surface of the disk
 @author: Alexis Larrañaga - 2023
 ===============================================================================
 """
-from numpy import cos, sqrt, arccos, pi, log, linspace, min
+from numpy import cos, sqrt, arccos, pi, log, linspace, min, where, clip
 from scipy.interpolate import interp1d
 
 class structure:
@@ -49,6 +49,14 @@ class structure:
         else:
             return 0.
 
+    def intensity_batch(self, r):
+        '''
+        Energy flux for an array of radii. It is zero outside the disk, and
+        the edges count as inside
+        '''
+        inside = (r >= self.in_edge) & (r <= self.out_edge)
+        return where(inside, self.energy(clip(r, self.in_edge, self.out_edge)), 0.)
+
 
 
 
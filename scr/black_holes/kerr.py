@@ -11,6 +11,103 @@ Kerr metric
 """
 
 from numpy import sin, cos, sqrt
+import math
+from numba import njit
+
+@njit(cache=True, error_model='numpy')
+def _geodesics_nb(q, lmbda, a):
+    '''
+    This function contains the geodesic equations in Hamiltonian form for 
+    photons moving in the Kerr spacetime
+    ===========================================================================
+    Coordinates and momentum components
+    t = q[0]
+    r = q[1]
+    theta = q[2]
+    phi = q[3]
+    k_t = q[4]
+    k_r = q[5]
+    k_th = q[6]
+    k_phi = q[7]
+    ===========================================================================
+    Conserved Quantities
+    E = - k_t = - q[4]
+    L = k_phi = q[7]
+    ===========================================================================
+    '''
+
+    # Auxiliar Functions
+    r2 = q[1]*q[1]
+    a2 = a*a
+    sin_th = math.sin(q[2])
+    cos_th = math.cos(q[2])
+    sin_th2 = sin_th*sin_th
+    cos_th2 = cos_th*cos_th
+    Sigma = r2 + a2*cos_th2
+    Delta = r2 - 2*q[1] + a2
+    # The common denominators are inverted only once: divisions are much
+    # slower than products, and the compiler cannot replace them by itself
+    inv_Sigma = 1/Sigma
+    inv_Sigma2 = inv_Sigma*inv_Sigma
+    inv_Delta = 1/Delta
+    inv_sin_th2 = 1/sin_th2
+    inv_2DeltaSigma = 0.5*inv_Delta*inv_Sigma
+
+    W = -q[4]*(r2 + a2) - a*q[7] 
+    partXi = r2 + (q[7] + a*q[4])**2 + a2*(1 + q[4]*q[4])*cos_th2 + q[7]*q[7]*cos_th2*inv_sin_th2
+    Xi = W**2 - Delta*partXi
+    Xi_DeltaSigma2 = Xi*inv_Delta*inv_Sigma2
+
+    dXidE = 2*W*(r2 + a2) + 2.*a*Delta*(q[7] + a*q[4]*sin_th2)
+    dXidL = -2*a*W - 2*a*q[4]*Delta - 2*q[7]*Delta*inv_sin_th2
+
+    dXidr = -4*q[1]*q[4]*W - 2*(q[1] - 1)*partXi - 2*q[1]*Delta 
+
+    dAdr = (q[1] - 1)*inv_Sigma - q[1]*Delta*inv_Sigma2
+    dBdr = -q[1]*inv_Sigma2
+    dCdr = dXidr*inv_2DeltaSigma - Xi*(q[1]-1)*inv_Sigma*inv_Delta*inv_Delta - q[1]*Xi_DeltaSigma2
+
+    auxth = a2*cos_th*sin_th
+
+    dAdth = Delta*auxth*inv_Sigma2
+    dBdth = auxth*inv_Sigma2
+    dCdth = ((1+q[4]**2)*auxth + q[7]*q[7]*cos_th*inv_sin_th2/sin_th)*inv_Sigma + Xi_DeltaSigma2*auxth
+
+    # Geodesics differential equations 
+    dtdlmbda = dXidE*inv_2DeltaSigma
+    drdlmbda = Delta*inv_Sigma*q[5]
+    dthdlmbda = q[6]*inv_Sigma
+    dphidlmbda = - dXidL*inv_2DeltaSigma
+    
+    dk_tdlmbda = 0.
+    dk_rdlmbda = -dAdr*q[5]*q[5] - dBdr*q[6]*q[6] + dCdr 
+    dk_thdlmbda = -dAdth*q[5]*q[5] - dBdth*q[6]*q[6] + dCdth 
+    dk_phidlmbda = 0.
+    
+    return (dtdlmbda, drdlmbda, dthdlmbda, dphidlmbda, 
+            dk_tdlmbda, dk_rdlmbda, dk_thdlmbda, dk_phidlmbda)
+
+
+@njit(cache=True, error_model='numpy')
+def _redshift_nb(q, a):
+    '''
+    Redshift factor of a photon with coordinates and momentum q, emitted by
+    a particle of the accretion disk moving in a corotating circular orbit.
+    Same as the factor used in doppler_shift, but compiled. It must be kept
+    in sync with metric and Omega
+    '''
+    # Metric components
+    r2 = q[1]*q[1]
+    a2 = a*a
+    sin_theta2 = math.sin(q[2])**2
+    Sigma = r2 + a2*math.cos(q[2])**2
+    g_tt = -(1 - 2*q[1]/Sigma)
+    g_phph = (r2 + a2 + 2*a2*q[1]*sin_theta2/Sigma)*sin_theta2
+    g_tph = -2*a*q[1]*sin_theta2/Sigma
+    # Angular velocity of the emitter
+    Omega = 1/(q[1]**(3/2) + a)
+    return math.sqrt(- g_tt - 2*g_tph*Omega - g_phph*Omega**2)/(1 + q[7]*Omega/q[4])
+
 
 class BlackHole:
     '''
@@ -23,6 +120,10 @@ class BlackHole:
         Z2 = sqrt(3*self.a**2 + Z1**2)
         self.ISCOco = 3 + Z2 - sqrt((3 - Z1)*(3 + Z1 + 2*Z2)) 
         self.ISCOcounter = 3 + Z2 + sqrt((3 - Z1)*(3 + Z1 + 2*Z2))
+        # Compiled geodesic equations, redshift factor and their parameters
+        self.geodesics_nb = _geodesics_nb
+        self.redshift_nb = _redshift_nb
+        self.params = (self.a,)
 
     
     def Omega(self, r, corotating=True):
@@ -94,67 +195,9 @@ class BlackHole:
     def geodesics(self, q, lmbda):
         '''
         This function contains the geodesic equations in Hamiltonian form for 
-        photons moving in the Kerr spacetime
-        ===========================================================================
-        Coordinates and momentum components
-        t = q[0]
-        r = q[1]
-        theta = q[2]
-        phi = q[3]
-        k_t = q[4]
-        k_r = q[5]
-        k_th = q[6]
-        k_phi = q[7]
-        ===========================================================================
-        Conserved Quantities
-        E = - k_t = - q[4]
-        L = k_phi = q[7]
-        ===========================================================================
+        photons moving in the Kerr spacetime (see _geodesics_nb)
         '''
-
-        # Auxiliar Functions
-        r2 = q[1]*q[1]
-        a2 = self.a*self.a
-        sin_th = sin(q[2])
-        cos_th = cos(q[2])
-        sin_th2 = sin_th*sin_th
-        cos_th2 = cos_th*cos_th
-        Sigma = r2 + a2*cos_th2
-        Sigma2 = Sigma*Sigma
-        Delta = r2 - 2*q[1] + a2
-
-        W = -q[4]*(r2 + a2) - self.a*q[7] 
-        partXi = r2 + (q[7] + self.a*q[4])**2 + a2*(1 + q[4]*q[4])*cos_th2 + q[7]*q[7]*cos_th2/sin_th2
-        Xi = W**2 - Delta*partXi
-
-        dXidE = 2*W*(r2 + a2) + 2.*self.a*Delta*(q[7] + self.a*q[4]*sin_th2)
-        dXidL = -2*self.a*W - 2*self.a*q[4]*Delta - 2*q[7]*Delta/sin_th2
-
-        dXidr = -4*q[1]*q[4]*W - 2*(q[1] - 1)*partXi - 2*q[1]*Delta 
-
-        dAdr = (q[1] - 1)/Sigma - (q[1]*Delta)/Sigma2
-        dBdr = -q[1]/Sigma**2
-        dCdr = dXidr/(2*Delta*Sigma) - (Xi*(q[1]-1))/(Sigma*Delta*Delta) - q[1]*Xi/(Delta*Sigma2)
-
-        auxth = a2*cos_th*sin_th
-
-        dAdth = Delta*auxth/Sigma2
-        dBdth = auxth/Sigma2
-        dCdth = ((1+q[4]**2)*auxth + q[7]*q[7] * cos_th/(sin_th2*sin_th) )/Sigma + (Xi/(Delta*Sigma2))*auxth
-
-        # Geodesics differential equations 
-        dtdlmbda = dXidE/(2.*Delta*Sigma)
-        drdlmbda = (Delta/Sigma)*q[5]
-        dthdlmbda = q[6]/Sigma
-        dphidlmbda = - dXidL/(2.*Delta*Sigma)
-        
-        dk_tdlmbda = 0.
-        dk_rdlmbda = -dAdr*q[5]*q[5] - dBdr*q[6]*q[6] + dCdr 
-        dk_thdlmbda = -dAdth*q[5]*q[5] - dBdth*q[6]*q[6] + dCdth 
-        dk_phidlmbda = 0.
-        
-        return [dtdlmbda, drdlmbda, dthdlmbda, dphidlmbda, 
-                dk_tdlmbda, dk_rdlmbda, dk_thdlmbda, dk_phidlmbda]
+        return _geodesics_nb(q, lmbda, self.a)
 
 
 
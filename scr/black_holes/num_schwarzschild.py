@@ -12,7 +12,8 @@ ds^2 = -(1-2M/r)dt^2 + dr^2 /(1-2M/r) + r^2 dtheta^2 + r^2 sin^2 (theta) dphi^2
 ===============================================================================
 """
 
-from numpy import sin, cos, loadtxt, linspace, asarray
+from numpy import sin, cos, loadtxt, linspace, asarray, zeros, gradient, \
+                  column_stack, moveaxis
 from scipy.interpolate import interp1d
 
 class BlackHole:
@@ -21,14 +22,24 @@ class BlackHole:
     '''
     def __init__(self):
         data = loadtxt('scr/black_holes/numerical_data/schwarzschild_data/N.txt')
-        self.N = interp1d(data[:,0], data[:,1])
+        r, N = data[:,0], data[:,1]
         data = loadtxt('scr/black_holes/numerical_data/schwarzschild_data/derN.txt')
-        self.dNdr = interp1d(data[:,0], data[:,1])
+        dNdr = data[:,1]
+        # N, dN/dr and d2N/dr2 are tabulated on the same radial grid, so they
+        # are interpolated together (see radial_functions)
+        self.N_table = interp1d(r, column_stack([N, dNdr, gradient(dNdr, r)]), axis=0)
         self.a = 0.
         self.EH = 2
         self.ISCOco = 6
         self.ISCOcounter = 6
 
+    def radial_functions(self, r):
+        '''
+        Returns N(r), dN/dr and d2N/dr2 with a single lookup in the table 
+        (r can be a number or an array)
+        '''
+        return moveaxis(self.N_table(r), -1, 0)
+
     def metric(self,x):
         '''
         This procedure contains the Schwarzschild metric non-zero components in 
@@ -41,9 +52,10 @@ class BlackHole:
         phi = x[3]
         ===========================================================================
         '''
+        N, _, _ = self.radial_functions(x[1])
         # Metric components
-        g_tt = - self.N(x[1])
-        g_rr = 1/self.N(x[1])
+        g_tt = - N
+        g_rr = 1/N
         g_thth = x[1]**2
         g_phph = (x[1]*sin(x[2]))**2
         g_tph = 0.
@@ -62,9 +74,10 @@ class BlackHole:
         phi = x[3]
         ===========================================================================
         '''
+        N, _, _ = self.radial_functions(x[1])
         # Metric components
-        gtt = - 1/self.N(x[1])
-        grr = self.N(x[1])
+        gtt = - 1/N
+        grr = N
         gthth = 1/x[1]**2
         gphph = 1/(x[1]*sin(x[2]))**2
         gtph = 0.
@@ -83,9 +96,10 @@ class BlackHole:
         phi = x[3]
         ===========================================================================
         '''
+        N, dNdr, _ = self.radial_functions(x[1])
         # Derivative of the metric components
-        drgtt =  self.dNdr(x[1])/(self.N(x[1])**2)
-        drgrr = self.dNdr(x[1])
+        drgtt =  dNdr/(N**2)
+        drgrr = dNdr
         drgthth = -2/x[1]**3
         drgphph = -2/(x[1]**3*sin(x[2])**2)
         drgtph = 0.
@@ -113,25 +127,73 @@ class BlackHole:
         L = k_phi
         ===========================================================================
         '''
-        # Metric and its numerical derivative
-        gtt, grr, gthth, gphph, gtph = self.inverse_metric(q[0:4])
-        drgtt, drgrr, drgthth, drgphph, drgtph = self.dr_inverse_metric(q[0:4])
+        # Metric function and its numerical derivative, from a single lookup
+        # (same equations as with inverse_metric and dr_inverse_metric)
+        N, dNdr, _ = self.radial_functions(q[1])
+        r2 = q[1]**2
+        sin_theta = sin(q[2])
+        sin_theta2 = sin_theta**2
         
         # Geodesics differential equations 
-        dtdlmbda = gtt*q[4]
-        drdlmbda = grr*q[5]
-        dthdlmbda = gthth*q[6]
-        dphidlmbda = gphph*q[7]
+        dtdlmbda = -q[4]/N
+        drdlmbda = N*q[5]
+        dthdlmbda = q[6]/r2
+        dphidlmbda = q[7]/(r2*sin_theta2)
         
         dk_tdlmbda = 0.
-        dk_rdlmbda = - (drgtt*q[4]**2)/2 - (drgrr*q[5]**2)/2 \
-                     - (drgthth*q[6]**2)/2 - (drgphph*q[7]**2)/2
-        dk_thdlmbda = (cos(q[2])/sin(q[2])**3)*(q[7]/q[1])**2
+        dk_rdlmbda = - (dNdr*q[4]**2)/(2*N**2) - (dNdr*q[5]**2)/2 \
+                     + q[6]**2/(r2*q[1]) + q[7]**2/(r2*q[1]*sin_theta2)
+        dk_thdlmbda = (cos(q[2])/(sin_theta2*sin_theta))*(q[7]/q[1])**2
         dk_phidlmbda = 0.
         
         return [dtdlmbda, drdlmbda, dthdlmbda, dphidlmbda, 
                 dk_tdlmbda, dk_rdlmbda, dk_thdlmbda, dk_phidlmbda]
 
+    def geodesics_jac(self, q, lmbda):
+        '''
+        Jacobian J[i,j] = d(dq_i/dlmbda)/dq_j of the geodesic equations.
+        q can also contain N photons (shape (8, N)); then J has shape (8, 8, N)
+        ===========================================================================
+        The second derivative of N is obtained from the tabulated derivative
+        ===========================================================================
+        '''
+        r = q[1]
+        N, dN, d2N = self.radial_functions(r)
+        sin_th = sin(q[2])
+        cos_th = cos(q[2])
+        r2 = r*r
+        r3 = r2*r
+        sin_th2 = sin_th*sin_th
+        sin_th3 = sin_th2*sin_th
+
+        J = zeros((8, 8) + r.shape)
+        # dt/dlmbda = - k_t/N
+        J[0,1] = q[4]*dN/N**2
+        J[0,4] = -1/N
+        # dr/dlmbda = N k_r
+        J[1,1] = dN*q[5]
+        J[1,5] = N
+        # dtheta/dlmbda = k_th/r^2
+        J[2,1] = -2*q[6]/r3
+        J[2,6] = 1/r2
+        # dphi/dlmbda = k_phi/(r sin(theta))^2
+        J[3,1] = -2*q[7]/(r3*sin_th2)
+        J[3,2] = -2*q[7]*cos_th/(r2*sin_th3)
+        J[3,7] = 1/(r2*sin_th2)
+        # dk_r/dlmbda
+        J[5,1] = - (d2N/N**2 - 2*dN**2/N**3)*q[4]**2/2 - d2N*q[5]**2/2 \
+                 - 3*q[6]**2/(r2*r2) - 3*q[7]**2/(r2*r2*sin_th2)
+        J[5,2] = -2*q[7]**2*cos_th/(r3*sin_th3)
+        J[5,4] = -dN*q[4]/N**2
+        J[5,5] = -dN*q[5]
+        J[5,6] = 2*q[6]/r3
+        J[5,7] = 2*q[7]/(r3*sin_th2)
+        # dk_th/dlmbda = (cos(theta)/sin(theta)^3)*(k_phi/r)^2
+        J[6,1] = -2*cos_th*q[7]**2/(sin_th3*r3)
+        J[6,2] = -(sin_th2 + 3*cos_th**2)*q[7]**2/(sin_th2*sin_th2*r2)
+        J[6,7] = 2*cos_th*q[7]/(sin_th3*r2)
+        return J
+
 
 
 
@@ -11,7 +11,7 @@ ds^2 = g_tt dt^2 + g_rr dr^2  + r^2 dtheta^2 + r^2 sin^2 (theta) dphi^2
 ===============================================================================
 """
 
-from numpy import sin, cos, loadtxt, linspace, asarray
+from numpy import sin, cos, loadtxt, linspace, asarray, moveaxis
 from scipy.interpolate import interp1d
 
 class BlackHole:
@@ -26,12 +26,17 @@ class BlackHole:
         self.ISCOcounter = 3*self.M
         # Load numerical metric
         data = loadtxt('metrics/numerical_data/scalarBH/phi1=5.0/metricpp0=1.6.txt')
-        self.g_tt = interp1d(data[:,0], data[:,1], bounds_error=False, fill_value = 0)
-        self.g_rr = interp1d(data[:,0], data[:,2], bounds_error=False, fill_value = 0)
-        self.gtt = interp1d(data[:,0], data[:,3], bounds_error=False, fill_value = 0)
-        self.grr = interp1d(data[:,0], data[:,4], bounds_error=False, fill_value = 0)
-        self.drgtt = interp1d(data[:,0], data[:,5], bounds_error=False, fill_value = 0)
-        self.drgrr = interp1d(data[:,0], data[:,6], bounds_error=False, fill_value = 0)
+        # g_tt, g_rr, g^tt, g^rr, dg^tt/dr and dg^rr/dr are tabulated on the
+        # same radial grid, so they are interpolated together
+        # (see radial_functions)
+        self.table = interp1d(data[:,0], data[:,1:7], axis=0, bounds_error=False, fill_value = 0)
+
+    def radial_functions(self, r):
+        '''
+        Returns g_tt, g_rr, g^tt, g^rr, dg^tt/dr and dg^rr/dr at r with a
+        single lookup in the table (r can be a number or an array)
+        '''
+        return moveaxis(self.table(r), -1, 0)
 
     def metric(self,x):
         '''
@@ -46,8 +51,7 @@ class BlackHole:
         ===========================================================================
         '''
         # Metric components
-        g_tt = self.g_tt(x[1])
-        g_rr = self.g_rr(x[1])
+        g_tt, g_rr, _, _, _, _ = self.radial_functions(x[1])
         g_thth = x[1]**2
         g_phph = (x[1]*sin(x[2]))**2
         g_tph = 0.
@@ -75,18 +79,17 @@ class BlackHole:
         L = k_phi
         ===========================================================================
         '''
-        # Metric and its numerical derivative
-        #gtt, grr, gthth, gphph, gtph = self.inverse_metric(q[0:4])
-        #drgtt, drgrr, drgthth, drgphph, drgtph = self.dr_inverse_metric(q[0:4])
+        # Inverse metric and its numerical derivative, from a single lookup
+        _, _, gtt, grr, drgtt, drgrr = self.radial_functions(q[1])
         
         # Geodesics differential equations 
-        dtdlmbda = self.gtt(q[1])*q[4]
-        drdlmbda = self.grr(q[1])*q[5]
+        dtdlmbda = gtt*q[4]
+        drdlmbda = grr*q[5]
         dthdlmbda = (1./q[1]**2)*q[6]
         dphidlmbda = (1./(q[1]*sin(q[2]))**2)*q[7]
         
         dk_tdlmbda = 0.
-        dk_rdlmbda = - (self.drgtt(q[1])*q[4]**2)/2 - (self.drgrr(q[1])*q[5]**2)/2 \
+        dk_rdlmbda = - (drgtt*q[4]**2)/2 - (drgrr*q[5]**2)/2 \
                      - ((-2/q[1]**3)*q[6]**2)/2 - ((-2/(q[1]**3*sin(q[2])**2))*q[7]**2)/2
         dk_thdlmbda = (cos(q[2])/sin(q[2])**3)*(q[7]/q[1])**2
         dk_phidlmbda = 0.
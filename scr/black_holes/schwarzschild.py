@@ -14,6 +14,64 @@ ds^2 = -(1-2M/r)dt^2 + dr^2 /(1-2M/r) + r^2 dtheta^2 + r^2 sin^2 (theta) dphi^2
 """
 
 from numpy import sin, cos
+import math
+from numba import njit
+
+@njit(cache=True, error_model='numpy')
+def _geodesics_nb(q, lmbda):
+    '''
+    This function contains the geodesic equations in Hamiltonian form for 
+    the Schwarzschild metric
+    ===========================================================================
+    Coordinates and momentum components
+    t = q[0]
+    r = q[1]
+    theta = q[2]
+    phi = q[3]
+    k_t = q[4]
+    k_r = q[5]
+    k_th = q[6]
+    k_phi = q[7]
+    ===========================================================================
+    Conserved Quantities
+    E = - k_t = -q[4]
+    L = k_phi = q[7]
+    ===========================================================================
+    '''
+    # Auxiliar functions
+    sin_theta = math.sin(q[2])
+    f = 1 - 2/q[1]
+    # Geodesics differential equations 
+    dtdlmbda =  -q[4]/f  #q[4]*q[1]**2/(q[1]**2 - 2*q[1])
+    drdlmbda =  f*q[5]         #(1 - 2/q[1])*q[5]
+    dthdlmbda = q[6]/q[1]**2
+    dphidlmbda = q[7]/((q[1]*sin_theta)**2)
+    
+    dk_tdlmbda = 0.
+    dk_rdlmbda = -(q[4]/(q[1]-2))**2 - (q[5]/q[1])**2 + q[6]**2/q[1]**3 \
+                 + q[7]**2/((q[1]**3)*sin_theta**2)
+    dk_thdlmbda = (math.cos(q[2])/sin_theta**3)*(q[7]/q[1])**2
+    dk_phidlmbda = 0.
+    
+    return (dtdlmbda, drdlmbda, dthdlmbda, dphidlmbda, 
+            dk_tdlmbda, dk_rdlmbda, dk_thdlmbda, dk_phidlmbda)
+
+
+@njit(cache=True, error_model='numpy')
+def _redshift_nb(q):
+    '''
+    Redshift factor of a photon with coordinates and momentum q, emitted by
+    a particle of the accretion disk moving in a circular orbit.
+    Same as the factor used in doppler_shift, but compiled. It must be kept
+    in sync with metric and Omega
+    '''
+    # Metric components
+    g_tt = -(1 - 2/q[1])
+    g_phph = (q[1]*math.sin(q[2]))**2
+    # Angular velocity of the emitter
+    Omega = 1/(q[1]**(3/2))
+    return math.sqrt(- g_tt - g_phph*Omega**2)/(1 + q[7]*Omega/q[4])
+
 
 class BlackHole:
     '''
@@ -24,6 +82,10 @@ class BlackHole:
         self.EH = 2
         self.ISCOco = 6
         self.ISCOcounter = 6
+        # Compiled geodesic equations, redshift factor and their parameters
+        self.geodesics_nb = _geodesics_nb
+        self.redshift_nb = _redshift_nb
+        self.params = ()
 
     def Omega(self, r, corotating=True):
             '''
@@ -78,40 +140,9 @@ class BlackHole:
     def geodesics(self, q, lmbda):
         '''
         This function contains the geodesic equations in Hamiltonian form for 
-        the Schwarzschild metric
-        ===========================================================================
-        Coordinates and momentum components
-        t = q[0]
-        r = q[1]
-        theta = q[2]
-        phi = q[3]
-        k_t = q[4]
-        k_r = q[5]
-        k_th = q[6]
-        k_phi = q[7]
-        ===========================================================================
-        Conserved Quantities
-        E = - k_t = -q[4]
-        L = k_phi = q[7]
-        ===========================================================================
+        the Schwarzschild metric (see _geodesics_nb)
         '''
-        # Auxiliar functions
-        sin_theta = sin(q[2])
-        f = 1 - 2/q[1]
-        # Geodesics differential equations 
-        dtdlmbda =  -q[4]/f  #q[4]*q[1]**2/(q[1]**2 - 2*q[1])
-        drdlmbda =  f*q[5]         #(1 - 2/q[1])*q[5]
-        dthdlmbda = q[6]/q[1]**2
-        dphidlmbda = q[7]/((q[1]*sin_theta)**2)
-        
-        dk_tdlmbda = 0.
-        dk_rdlmbda = -(q[4]/(q[1]-2))**2 - (q[5]/q[1])**2 + q[6]**2/q[1]**3 \
-                     + q[7]**2/((q[1]**3)*sin_theta**2)
-        dk_thdlmbda = (cos(q[2])/sin_theta**3)*(q[7]/q[1])**2
-        dk_phidlmbda = 0.
-        
-        return [dtdlmbda, drdlmbda, dthdlmbda, dphidlmbda, 
-                dk_tdlmbda, dk_rdlmbda, dk_thdlmbda, dk_phidlmbda]
+        return _geodesics_nb(q, lmbda)
 
 
 
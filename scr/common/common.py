@@ -5,12 +5,23 @@ Common functions for ray tracing in a curved spacetime
 @author: Alexis Larrañaga - 2023
 ===============================================================================
 """
-from scipy.integrate import odeint
-from numpy import linspace, cos, sqrt, zeros, where, roll, save
+from scipy.integrate import odeint, solve_ivp
+from numpy import linspace, cos, sqrt, zeros, empty, where, save, argmax, \
+                  arange, int32, int64, sign, vstack, ascontiguousarray, \
+                  column_stack, float32, zeros_like
 from numpy.random import randint
+from numba import njit, prange, get_num_threads, parallel_chunksize, cuda, \
+                  float64
+from numba.core.errors import NumbaError
+from numba.cuda.cudadrv import error as cuda_error
 import matplotlib.pyplot as plt
 import sys
+import math
 import time
+import warnings
+from weakref import WeakKeyDictionary
+
+from scr.common.integrator import dop853_step
 
 
 class Photon:
@@ -36,62 +47,366 @@ class Photon:
         self.fP = None
 
 
-def geodesic_integrate(p, blackhole, acc_structure, detector):
-    '''
-    Integrates the motion equations of the photon 
-    '''
-    final_lmbda = 1.5*detector.D
-    lmbda = linspace(0, -final_lmbda, int(7*final_lmbda))
-    sol = odeint(blackhole.geodesics, p.iC, lmbda)
-    p.fP = [0.,0.,0.,0.,0.,0.,0.,0.]
-    I_f = 0.
-    zi = cos(sol[:,2])
-    zi1 = roll(zi,-1)
-    zi1[-1] = 0.
-    indxs = where(zi*zi1 < 0)[0]
-    for i in indxs: 
-        if sol[i,1] < acc_structure.out_edge and sol[i,1] > acc_structure.in_edge:
-            p.fP = sol[i]
-            I_0 = acc_structure.intensity(p.fP[1])
-            I_f = doppler_shift(p, I_0, blackhole)
+# Status of a traced photon
+ESCAPED, HIT, CAPTURED = 0, 1, 2
+
+# Emission profile used when there is no accretion structure
+NO_EMISSION = zeros(2)
+
+# Number of radii at which the emission profile is tabulated
+EMISSION_SAMPLES = 100000
+
+
+# trace_photon, received_intensity and trace_batch receive the compiled 
+# motion equations as arguments. Numba types them by the address of the 
+# function, which changes in every process, so they are not cached on disk 
+# (a cache entry would never be hit and a new one would be written each run)
+@njit(error_model='numpy')
+def trace_photon(rhs, params, q0, final_lmbda, r_eh, r_in, r_out, r_esc,
+                 K, y, y_new, y_x, rtol=1e-8, atol=1e-8, h_max=10., 
+                 max_steps=100000):
+    '''
+    Integrates the motion equations of the photon with an adaptive 
+    8th order Dormand-Prince (DOP853) stepper, stopping as soon as the photon
+    - crosses the accretion structure (r_in < r < r_out): returns HIT and 
+      leaves in y_x the point of the crossing
+    - falls into the black hole (r < r_eh): returns CAPTURED
+    - moves outwards beyond r_esc, or reaches lmbda = -final_lmbda: 
+      returns ESCAPED
+    The integration is abandoned (ESCAPED) after max_steps attempted steps.
+    K (shape (13, 8)), y, y_new and y_x (length 8) are work arrays, passed 
+    in so that the same function runs on the GPU with thread-local arrays
+    '''
+    for i in range(8):
+        y[i] = q0[i]
+    t = 0.
+    h = -0.1
+    for _ in range(max_steps):
+        if t <= -final_lmbda:
             break
+        if t + h < -final_lmbda:
+            h = -final_lmbda - t
+        err = dop853_step(rhs, params, t, y, h, atol, rtol, K, y_new)
+        if err <= 1.:
+            # Crossing of the equatorial plane. The steps are long, so the
+            # crossing is located with a few secant iterations, each one 
+            # re-stepping from y with a fraction of h
+            z0 = math.cos(y[2])
+            z1 = math.cos(y_new[2])
+            if z0*z1 < 0:
+                s0, s1 = 0., 1.
+                for _ in range(6):
+                    s = s1 - z1*(s1 - s0)/(z1 - z0)
+                    dop853_step(rhs, params, t, y, s*h, atol, rtol, K, y_x)
+                    s0, z0 = s1, z1
+                    s1, z1 = s, math.cos(y_x[2])
+                    if abs(z1) < 1e-12:
+                        break
+                if y_x[1] > r_in and y_x[1] < r_out:
+                    return HIT
+            t += h
+            if y_new[1] < r_eh:
+                return CAPTURED
+            if y_new[1] > r_esc and y_new[1] > y[1]:
+                return ESCAPED
+            for i in range(8):
+                y[i] = y_new[i]
+            scale = 10. if err == 0. else min(max(0.9*err**-0.125, 0.2), 10.)
+        elif err != err:
+            scale = 0.2
+        else:
+            scale = min(max(0.9*err**-0.125, 0.2), 1.)
+        h = max(-h_max, h*scale)
+    return ESCAPED
+
+@njit(cache=True)
+def emission(r, r_table, I_table):
+    '''
+    Intensity emitted by the accretion structure at radius r, linearly 
+    interpolated in its emission profile (r_table increasing)
+    '''
+    lo = 0
+    hi = r_table.shape[0] - 1
+    while hi - lo > 1:
+        mid = (lo + hi)//2
+        if r_table[mid] > r:
+            hi = mid
+        else:
+            lo = mid
+    s = (r - r_table[lo])/(r_table[hi] - r_table[lo])
+    return I_table[lo] + s*(I_table[hi] - I_table[lo])
+
+@njit(error_model='numpy')
+def received_intensity(redshift, params, q, r_table, I_table, doppler):
+    '''
+    Intensity received from a photon that left the accretion structure at
+    the point q, Doppler shifted if doppler is True
+    '''
+    I = emission(q[1], r_table, I_table)
+    if doppler:
+        I *= redshift(q, *params)**3
+    return I
+
+@njit(parallel=True)
+def trace_batch(rhs, redshift, params, iC, final_lmbda, r_eh, r_in, r_out, 
+                r_esc, r_table, I_table, doppler):
+    '''
+    Traces a batch of photons with initial conditions iC (shape (N, 8)).
+    The photons are independent and are distributed among all the 
+    available threads. Returns the intensity received from each photon
+    (computed at the crossing, see received_intensity) and its status
+    '''
+    N = iC.shape[0]
+    I = zeros(N)
+    status = empty(N, int64)
+    for n in prange(N):
+        y_x = empty(8)
+        status[n] = trace_photon(rhs, params, iC[n], final_lmbda, r_eh, 
+                                 r_in, r_out, r_esc, empty((13, 8)),
+                                 empty(8), empty(8), y_x)
+        if status[n] == HIT:
+            I[n] = received_intensity(redshift, params, y_x, r_table, 
+                                      I_table, doppler)
+    return I, status
+
+def make_trace_kernel(rhs, redshift):
+    '''
+    Builds the CUDA kernel that traces a batch of photons with the 
+    motion equations rhs, one thread per photon. The work arrays of 
+    each thread live in its local memory
+    '''
+    @cuda.jit
+    def trace_kernel(iC, params, final_lmbda, r_eh, r_in, r_out, r_esc, 
+                     r_table, I_table, doppler, I, status):
+        n = cuda.grid(1)
+        if n < iC.shape[0]:
+            K = cuda.local.array((13, 8), float64)
+            y = cuda.local.array(8, float64)
+            y_new = cuda.local.array(8, float64)
+            y_x = cuda.local.array(8, float64)
+            # The CUDA target does not fill in default arguments
+            status[n] = trace_photon(rhs, params, iC[n], final_lmbda, r_eh, 
+                                     r_in, r_out, r_esc, K, y, y_new, y_x, 
+                                     1e-8, 1e-8, 10., 100000)
+            if status[n] == HIT:
+                I[n] = received_intensity(redshift, params, y_x, r_table, 
+                                          I_table, doppler)
+    return trace_kernel
+
+# CUDA kernels already built, one for each set of motion equations (None
+# when the kernel could not be compiled)
+trace_kernels = {}
+
+# Errors raised when a CUDA kernel cannot be compiled: typing or lowering
+# errors, and NVVM errors (not defined by the CUDA simulator)
+CUDA_COMPILE_ERRORS = (NumbaError,) + tuple(
+    getattr(cuda_error, name) for name in ('NvvmError', 'NvvmSupportError')
+    if hasattr(cuda_error, name))
+
+def trace_batch_cuda(rhs, redshift, params, iC, final_lmbda, r_eh, r_in, 
+                     r_out, r_esc, r_table, I_table, doppler, threads=256):
+    '''
+    Traces a batch of photons with initial conditions iC (shape (N, 8)) 
+    on the GPU. Same arguments and results as trace_batch. The emission 
+    profile (r_table, I_table) can already be on the GPU (see emission_table)
+    '''
+    if (rhs, redshift) not in trace_kernels:
+        trace_kernels[rhs, redshift] = make_trace_kernel(rhs, redshift)
+    N = len(iC)
+    d_iC = cuda.to_device(ascontiguousarray(iC))
+    I = cuda.to_device(zeros(N))
+    status = cuda.device_array(N, int64)
+    blocks = (N + threads - 1)//threads
+    trace_kernels[rhs, redshift][blocks, threads](
+        d_iC, params, final_lmbda, r_eh, r_in, r_out, r_esc, 
+        r_table, I_table, doppler, I, status)
+    return I.copy_to_host(), status.copy_to_host()
+
+# In the odeint fallback the evolution of the photons falling into the black
+# hole is smoothly switched off between r = EH + R_CAPTURE and
+# r = EH + R_FREEZE, so that they do not reduce the step size of the whole
+# batch. The photons that get inside r = EH + R_CAPTURE are captured
+R_CAPTURE = 0.1
+R_FREEZE = 0.05
+
+# The compiled tracer adapts the step of each photon on its own, so nothing
+# has to be frozen and it follows the photons down to r = EH + R_CAPTURE_NB.
+# Both margins are inside the unstable photon orbits, where an infalling 
+# photon can no longer escape, so both paths capture the same photons
+R_CAPTURE_NB = 1e-3
+
+def switch_off(r, EH):
+    '''
+    Switch-off factor w(r) of the photons falling into the black hole
+    (w = 1 outside EH + R_CAPTURE, w = 0 inside EH + R_FREEZE) and its
+    derivative dw/dr
+    '''
+    width = R_CAPTURE - R_FREEZE
+    x = ((r - EH - R_FREEZE)/width).clip(0, 1)
+    return x*x*(3 - 2*x), 6*x*(1 - x)/width
+
+def geodesics_batched(Y, lmbda, blackhole):
+    '''
+    Geodesic equations for N photons integrated simultaneously. The states
+    of all the photons are stacked in a single vector
+    Y = [q_0, q_1, ..., q_{N-1}] with 8N components
+    '''
+    q = Y.reshape(-1, 8).T
+    dq = zeros_like(q)
+    for i, dqi in enumerate(blackhole.geodesics(q, lmbda)):
+        dq[i] = dqi
+    w, _ = switch_off(q[1], blackhole.EH)
+    return (dq*w).T.ravel()
+
+def geodesics_jac_batched(Y, lmbda, blackhole):
+    '''
+    Jacobian of geodesics_batched, from the Jacobian of the geodesic
+    equations of one photon (blackhole.geodesics_jac). The photons are
+    independent, so it is block diagonal and it is returned in the banded
+    form used by odeint (ml = mu = 7): jac[i - j + 7, j] = d(dY_i/dlmbda)/dY_j
+    '''
+    q = Y.reshape(-1, 8).T
+    J = blackhole.geodesics_jac(q, lmbda)
+    w, dw = switch_off(q[1], blackhole.EH)
+    J *= w
+    for i, dqi in enumerate(blackhole.geodesics(q, lmbda)):
+        J[i,1] += dqi*dw
+    jac = zeros((15, len(Y)))
+    for i in range(8):
+        for j in range(8):
+            jac[i - j + 7, j::8] = J[i,j]
+    return jac
+
+def integrate_batch(iC, blackhole, lmbda):
+    '''
+    Integrates the motion equations of a batch of photons with initial 
+    conditions iC (shape (N, 8)) with a single call to odeint. 
+    The solution is returned with shape (len(lmbda), N, 8)
+    '''
+    # Photons are independent, so the Jacobian of the batch is block diagonal.
+    # It is evaluated analytically when the black hole provides it
+    Dfun = geodesics_jac_batched if hasattr(blackhole, 'geodesics_jac') else None
+    sol = odeint(geodesics_batched, iC.ravel(), lmbda, args=(blackhole,),
+                 Dfun=Dfun, ml=7, mu=7)
+    return sol.reshape(len(lmbda), len(iC), 8)
+
+def disk_crossing(sol, r_in, r_out):
+    '''
+    Finds the first point where each photon of the batch crosses the 
+    accretion structure. Returns the index of the crossing along the 
+    trajectory and a mask of the photons that hit the structure
+    '''
+    zi = cos(sol[:,:,2])
+    r = sol[:-1,:,1]
+    cond = (zi[:-1]*zi[1:] < 0) & (r < r_out) & (r > r_in)
+    return argmax(cond, axis=0), cond.any(axis=0)
+
+# Emission profiles already tabulated, for each accretion structure (while
+# it exists), with the edges they were tabulated between and their copy on 
+# the GPU, once it is made
+emission_tables = WeakKeyDictionary()
+
+def emission_table(acc_structure, device=False):
+    '''
+    Emission profile of the accretion structure, tabulated with its 
+    intensity_batch at EMISSION_SAMPLES radii between its edges, for the 
+    compiled ray tracer (see emission). It is computed again only if the 
+    edges of the structure change. With device=True returns its copy on the
+    GPU, also made only once
+    '''
+    if acc_structure is None:
+        return NO_EMISSION, NO_EMISSION
+    edges = (acc_structure.in_edge, acc_structure.out_edge)
+    entry = emission_tables.get(acc_structure)
+    if entry is None or entry['edges'] != edges:
+        r_table = linspace(*edges, EMISSION_SAMPLES)
+        entry = {'edges': edges, 
+                 'tables': (r_table, acc_structure.intensity_batch(r_table))}
+        emission_tables[acc_structure] = entry
+    if device:
+        if 'device' not in entry:
+            entry['device'] = tuple(cuda.to_device(t) for t in entry['tables'])
+        return entry['device']
+    return entry['tables']
+
+def trace_photons(iC, blackhole, lmbda, acc_structure=None, doppler=False,
+                  use_gpu=False):
+    '''
+    Integrates the motion equations of a batch of photons with initial 
+    conditions iC (shape (N, 8)) until they cross the accretion structure, 
+    fall into the black hole or escape. Returns the intensity received from 
+    each photon (zero unless it hits the structure, Doppler shifted if 
+    doppler is True) and its status (HIT, CAPTURED or ESCAPED).
+    With use_gpu the compiled integration runs on the GPU, when there is one
+    '''
+    if acc_structure is None:
+        # Nothing to hit
+        r_in = r_out = 0.
+    else:
+        r_in, r_out = acc_structure.in_edge, acc_structure.out_edge
+
+    if hasattr(blackhole, 'geodesics_nb'):
+        # Compiled integration, stopped at the first event
+        r_esc = max(r_out, 4*blackhole.EH)
+        args = (blackhole.geodesics_nb, blackhole.redshift_nb, 
+                blackhole.params, iC, -lmbda[-1], blackhole.EH + R_CAPTURE_NB,
+                r_in, r_out, r_esc)
+        key = blackhole.geodesics_nb, blackhole.redshift_nb
+        if use_gpu and cuda.is_available() and trace_kernels.get(key, True):
+            try:
+                return trace_batch_cuda(*args, 
+                                        *emission_table(acc_structure, True), 
+                                        doppler)
+            except CUDA_COMPILE_ERRORS as e:
+                # The kernel is compiled at its first launch
+                warnings.warn('The CUDA kernel could not be compiled, the '
+                              'photons are traced on the CPU.\n%s' % e)
+                trace_kernels[key] = None
+        # The cost of a photon depends strongly on its trajectory (photons 
+        # grazing the black hole need many more steps), so the photons are 
+        # handed out to the threads in small chunks on demand instead of in 
+        # equal contiguous blocks
+        with parallel_chunksize(max(1, len(iC)//(8*get_num_threads()))):
+            return trace_batch(*args, *emission_table(acc_structure), doppler)
+    
+    sol = integrate_batch(iC, blackhole, lmbda)
+    indxs, hit = disk_crossing(sol, r_in, r_out)
+    captured = (sol[:,:,1] < blackhole.EH + R_CAPTURE).any(axis=0)
+    status = where(hit, HIT, where(captured, CAPTURED, ESCAPED))
+    I = zeros(len(iC))
+    if hit.any():
+        # Emission of all the photons of the batch that hit the structure
+        fP = sol[indxs[hit], hit]
+        I[hit] = acc_structure.intensity_batch(fP[:,1])
+        if doppler:
+            I[hit] = doppler_shift(fP.T, I[hit], blackhole)
+    return I, status
+
+def geodesic_integrate(iC, blackhole, acc_structure, lmbda, use_gpu=False):
+    '''
+    Integrates the motion equations of a batch of photons 
+    '''
+    I_f, _ = trace_photons(iC, blackhole, lmbda, acc_structure, doppler=True,
+                           use_gpu=use_gpu)
     return I_f 
 
-def geo_integ_no_Doppler(p, blackhole, acc_structure, detector):
+def geo_integ_no_Doppler(iC, blackhole, acc_structure, lmbda, use_gpu=False):
     '''
-    Integrates the motion equations of the photon whitout 
+    Integrates the motion equations of a batch of photons whitout 
     Doppler shift
     '''
-    final_lmbda = 1.5*detector.D
-    lmbda = linspace(0, -final_lmbda, int(7*final_lmbda))
-    sol = odeint(blackhole.geodesics, p.iC, lmbda)
-    
-    p.fP = [0.,0.,0.,0.,0.,0.,0.,0.]
-    zi = cos(sol[:,2])
-    zi1 = roll(zi,-1)
-    zi1[-1] = 0.
-    indxs = where(zi*zi1 < 0)[0]
-    for i in indxs: 
-        if sol[i,1] < acc_structure.out_edge and sol[i,1] > acc_structure.in_edge:
-            p.fP = sol[i]
-            break
-    return acc_structure.intensity(p.fP[1])
+    I_f, _ = trace_photons(iC, blackhole, lmbda, acc_structure, use_gpu=use_gpu)
+    return I_f
 
-def shadow_integ(p, blackhole, detector):
+def shadow_integ(iC, blackhole, lmbda, use_gpu=False):
     '''
-    Integrates the motion equations of the photon to plot the shadow
-    of the black hole
+    Integrates the motion equations of a batch of photons to plot the 
+    shadow of the black hole
     '''
-    final_lmbda = 1.5*detector.D
-    lmbda = linspace(0, -final_lmbda, int(7*final_lmbda))
-    sol = odeint(blackhole.geodesics, p.iC, lmbda)
-    indxs = where(sol[:,1] < blackhole.EH + 1e-7)[0]
-    if len(indxs) == 0:
-        return 100
-    else:
-        return 0
+    _, status = trace_photons(iC, blackhole, lmbda, use_gpu=use_gpu)
+    return where(status == CAPTURED, 0, 100)
 
-def doppler_shift(p, I0, blackhole):
+def doppler_shift(fP, I0, blackhole):
     '''
     ===========================================================================
     Applies the Doppler shift to the image data
@@ -108,48 +423,76 @@ def doppler_shift(p, I0, blackhole):
     ===========================================================================
     '''
     # Metric components
-    g_tt, _, _, g_phph, g_tph = blackhole.metric(p.fP[:4])
-    Omega = blackhole.Omega(p.fP[1])
-    g = sqrt(- g_tt - 2*g_tph*Omega - g_phph*Omega**2)/(1 + p.fP[7]*Omega/p.fP[4])
+    g_tt, _, _, g_phph, g_tph = blackhole.metric(fP[:4])
+    Omega = blackhole.Omega(fP[1])
+    g = sqrt(- g_tt - 2*g_tph*Omega - g_phph*Omega**2)/(1 + fP[7]*Omega/fP[4])
     return I0 * g**3
 
-def integrate_for_H(p, blackhole, acc_structure, detector):
+def integrate_for_H(iC, blackhole, acc_structure, lmbda):
     '''
     Integrates the motion equations of the photon to verify
-    the Hamiltonian constraint 
-    '''
-    final_lmbda = 1.5*detector.D
-    lmbda = linspace(0, -final_lmbda, int(7*final_lmbda))
-    sol = odeint(blackhole.geodesics, p.iC, lmbda)
-    solution = sol
-    # Find the point where the photon crosses the accretion structure
-    zi = cos(sol[:,2])
-    zi1 = roll(zi,-1)
-    zi1[-1] = 0.
-    indxs = where(zi*zi1 < 0)[0]
-    for i in indxs: 
-        if sol[i,1] < acc_structure.out_edge and sol[i,1] > acc_structure.in_edge:
-            solution = sol[:i]
+    the Hamiltonian constraint. The integration stops when the photon 
+    crosses the accretion structure or reaches the event horizon
+    '''
+    def eh_event(t, y):
+        return y[1] - (blackhole.EH + 0.1)
+    eh_event.terminal = True
+    eh_event.direction = -1
+
+    # Crossing of the equatorial plane. The integration is restarted after
+    # each crossing outside the accretion structure, looking only for the 
+    # next crossing (in the opposite direction)
+    def disk_event(t, y):
+        return cos(y[2])
+    disk_event.terminal = True
+    side = sign(cos(iC[2]))
+
+    t0, y0 = 0., iC
+    solution = []
+    while True:
+        disk_event.direction = -side
+        sol = solve_ivp(lambda t, y: blackhole.geodesics(y, t), (t0, lmbda[-1]), 
+                        y0, method='DOP853', t_eval=lmbda[lmbda <= t0], 
+                        events=(eh_event, disk_event), rtol=1e-8, atol=1e-8)
+        solution.append(sol.y.T)
+        if sol.status != 1 or len(sol.t_events[0]) > 0:
+            break
+        t0, y0 = sol.t_events[1][0], sol.y_events[1][0]
+        if y0[1] < acc_structure.out_edge and y0[1] > acc_structure.in_edge:
             break
-    # Find the point where the photon crosses the event horizon
-    indxsEH = where(sol[:,1] < blackhole.EH + 0.1)[0]
-    for i in indxsEH:
-        solution = sol[:i]
+        side = -side
     # Calculate the Hamiltonian
-    H = Hamiltonian(solution, blackhole)
+    H = Hamiltonian(vstack(solution), blackhole)
     print('Hamiltonian constraint verified: |H_max - H_0 | = ', abs(H.max() - H[0]))
     return H
 
 def Hamiltonian(sol, blackhole):
-    H = zeros(len(sol))
-    for i in range(len(sol)):
-        x = sol[i,0:4]
-        p = sol[i,4:]
-        gtt, grr, gthth, gphph, gtph = blackhole.inverse_metric(x)
-        H[i] = 0.5*(gtt*p[0]*p[0] + grr*p[1]*p[1] + gthth*p[2]*p[2] + gphph*p[3]*p[3] + 2*gtph*p[0]*p[3])
-    return H
+    '''
+    Hamiltonian at every point of the trajectory sol (shape (n, 8)). The
+    inverse metric is evaluated on all the points at once
+    '''
+    x = sol[:,0:4].T
+    p = sol[:,4:].T
+    gtt, grr, gthth, gphph, gtph = blackhole.inverse_metric(x)
+    return 0.5*(gtt*p[0]*p[0] + grr*p[1]*p[1] + gthth*p[2]*p[2] + gphph*p[3]*p[3] + 2*gtph*p[0]*p[3])
+
+
+def report_progress(n, N, last):
+    '''
+    Writes the percentage of integrated photons (n out of N) when it differs
+    from the last one written, so that the terminal is written (and flushed)
+    at most 100 times per image. Returns the percentage written
+    '''
+    percent = 100*n//N
+    if percent != last:
+        sys.stdout.write("\rIntegrated photons: %d %%" % percent)
+        sys.stdout.flush()
+    return percent
 
 
+# Minimum number of photons traced in each launch of the CUDA kernel
+GPU_BATCH_SIZE = 2**18
+
 class Image:
     '''
     ===========================================================================
@@ -157,85 +500,106 @@ class Image:
     Creates the photon list and generates the image
     ===========================================================================
     '''
-    def __init__(self, blackhole, acc_structure, detector):
+    def __init__(self, blackhole, acc_structure, detector, use_gpu=False):
+        '''
+        The trajectories are integrated in double precision, but the image
+        data (one intensity per pixel) is stored in single precision.
+        With use_gpu the trajectories are integrated on the GPU (if there is
+        one), in batches of at least GPU_BATCH_SIZE photons
+        '''
         self.blackhole = blackhole
         self.acc_structure = acc_structure
         self.detector = detector
+        self.use_gpu = use_gpu
+        # Values of the affine parameter along the trajectories
+        final_lmbda = 1.5*detector.D
+        self.lmbda = linspace(0, -final_lmbda, int(7*final_lmbda))
 
     def create_photons(self):
         '''
-        Creates the photon array
+        Creates the photon arrays
         ========================================================================
-        This function creates the photon array with the initial coordinates
-        (alpha, beta) in the image plane. The photons are stored in a list
-        of Photon objects. The i and j coordinates are also stored in the
-        Photon object, which correspond to the pixel coordinates in the image.
+        This function creates the photons with the initial coordinates
+        (alpha, beta) in the image plane. The photons are stored as arrays:
+        iC (N, 8) contains the initial conditions of each photon, 
+        ij (N, 2) the pixel coordinates in the image and ab (N, 2) the 
+        coordinates (alpha, beta) in the image plane.
         ========================================================================
         '''
         print('Creating photons ...')
-        self.photon_list = []
-        i=0
-        for a in self.detector.alphaRange:
-            j = 0
-            for b in self.detector.betaRange:
-                p = Photon(alpha=a, beta=b)
-                p.iC = self.detector.photon_coords(self.blackhole, a, b)
-                p.i, p.j = i, j
-                self.photon_list.append(p)
-                j += 1
-            i += 1
+        # Photon n is the pixel (i, j) = (n // y_pixels, n % y_pixels)
+        n = arange(self.detector.x_pixels*self.detector.y_pixels)
+        i, j = n // self.detector.y_pixels, n % self.detector.y_pixels
+        self.ij = column_stack((i, j)).astype(int32)
+        self.ab = column_stack((self.detector.alphaRange[i], self.detector.betaRange[j]))
+        self.iC = self.detector.photon_coords_batch(self.blackhole, self.ab[:,0], self.ab[:,1])
+
+    def photon(self, n):
+        '''
+        Returns the n-th photon as a Photon object (for debugging)
+        '''
+        p = Photon(alpha=self.ab[n,0], beta=self.ab[n,1])
+        p.i, p.j = self.ij[n]
+        p.iC = self.iC[n]
+        return p
     
-    def create_image(self):
+    def create_image(self, batch_size=256):
         '''
         Creates the image data 
         '''
-        self.image_data = zeros([self.detector.x_pixels, self.detector.y_pixels])
-        photon=1
+        self.image_data = zeros([self.detector.x_pixels, self.detector.y_pixels], dtype=float32)
         print('Integrating trajectories ...')
         start_time = time.time()
-        for p in self.photon_list:
-            self.image_data[p.i, p.j] = geodesic_integrate(p, self.blackhole, self.acc_structure, self.detector)
-            sys.stdout.write("\rPhoton # %d" %photon)
-            sys.stdout.flush()
-            photon +=1
+        progress = -1
+        if self.use_gpu:
+            batch_size = max(batch_size, GPU_BATCH_SIZE)
+        for k in range(0, len(self.iC), batch_size):
+            I = geodesic_integrate(self.iC[k:k+batch_size], self.blackhole, self.acc_structure, self.lmbda, self.use_gpu)
+            i, j = self.ij[k:k+batch_size].T
+            self.image_data[i, j] = I
+            progress = report_progress(k + len(I), len(self.iC), progress)
         total_time= time.time() - start_time
         print("\n\n--- Total time of integration : %s seconds ---" % total_time)
-        print("\n--- Time of integration : %s seconds/photon ---\n" % (total_time/len(self.photon_list)))
+        print("\n--- Time of integration : %s seconds/photon ---\n" % (total_time/len(self.iC)))
         
-    def create_image_no_Doppler(self):
+    def create_image_no_Doppler(self, batch_size=256):
         '''
         Creates the image data with no Doppler shift 
         '''
-        self.image_data = zeros([self.detector.x_pixels, self.detector.y_pixels])
-        photon=1
+        self.image_data = zeros([self.detector.x_pixels, self.detector.y_pixels], dtype=float32)
         print('Integrating trajectories ...')
         start_time = time.time()
-        for p in self.photon_list:
-            self.image_data[p.i, p.j] = geo_integ_no_Doppler(p, self.blackhole, self.acc_structure, self.detector)
-            sys.stdout.write("\rPhoton # %d" %photon)
-            sys.stdout.flush()
-            photon +=1
+        progress = -1
+        if self.use_gpu:
+            batch_size = max(batch_size, GPU_BATCH_SIZE)
+        for k in range(0, len(self.iC), batch_size):
+            I = geo_integ_no_Doppler(self.iC[k:k+batch_size], self.blackhole, self.acc_structure, self.lmbda, self.use_gpu)
+            i, j = self.ij[k:k+batch_size].T
+            self.image_data[i, j] = I
+            progress = report_progress(k + len(I), len(self.iC), progress)
         total_time= time.time() - start_time
         print("\n\n--- Total time of integration : %s seconds ---" % total_time)
-        print("\n--- Time of integration : %s seconds/photon ---\n" % (total_time/len(self.photon_list)))
+        print("\n--- Time of integration : %s seconds/photon ---\n" % (total_time/len(self.iC)))
 
-    def create_shadow(self):
+    def create_shadow(self, batch_size=256):
         '''
         Creates the image data 
         '''
-        self.image_data = zeros([self.detector.x_pixels, self.detector.y_pixels])
-        photon=1
+        self.image_data = zeros([self.detector.x_pixels, self.detector.y_pixels], dtype=float32)
         print('Integrating trajectories ...')
         start_time = time.time()
-        for p in self.photon_list:
-            self.image_data[p.i, p.j] = shadow_integ(p, self.blackhole, self.detector)
-            sys.stdout.write("\rPhoton # %d" %photon)
-            sys.stdout.flush()
-            photon +=1
+        progress = -1
+        if self.use_gpu:
+            batch_size = max(batch_size, GPU_BATCH_SIZE)
+        for k in range(0, len(self.iC), batch_size):
+            I = shadow_integ(self.iC[k:k+batch_size], self.blackhole, self.lmbda, self.use_gpu)
+            i, j = self.ij[k:k+batch_size].T
+            self.image_data[i, j] = I
+            progress = report_progress(k + len(I), len(self.iC), progress)
         total_time= time.time() - start_time
         print("\n\nEH radius %s  ---" % self.blackhole.EH)
         print("\n\n--- Total time of integration : %s seconds ---" % total_time)
-        print("\n--- Time of integration : %s seconds/photon ---\n" % (total_time/len(self.photon_list)))
+        print("\n--- Time of integration : %s seconds/photon ---\n" % (total_time/len(self.iC)))
 
     def save_data(self, filename):
         save(filename+'.npy', self.image_data)
@@ -304,9 +668,8 @@ class Image:
         print('Integrating trajectories ...\n')
         ax = plt.figure(figsize=(10,7)).add_subplot()
         while photon < n:
-            i = randint(1,len(self.photon_list))
-            p = self.photon_list[i]
-            H = integrate_for_H(p, self.blackhole, self.acc_structure, self.detector)
+            i = randint(1,len(self.iC))
+            H = integrate_for_H(self.iC[i], self.blackhole, self.acc_structure, self.lmbda)
             ax.plot(H, label='Photon # %d' %i)
             photon +=1
         
@@ -1,4 +1,6 @@
 from math import sqrt, isfinite
+from numpy import array, zeros
+from numba import njit
 
 def rk45(f, t0, y0, t1, *, atol=1e-9, rtol=1e-9, h0=1e-2, h_min=1e-12, h_max=1.0,
          max_steps=1_000_000, t_eval=None):
@@ -203,6 +205,146 @@ def rk45(f, t0, y0, t1, *, atol=1e-9, rtol=1e-9, h0=1e-2, h_min=1e-12, h_max=1.0
         return T, Y
 
 
+# Coefficients of the 8th order Dormand–Prince method DOP853 (Hairer,
+# Norsett & Wanner), with the embedded 5th and 3rd order error estimators.
+# Stored as arrays so that they can be used from Numba
+DOP_C = array([0.0, 0.05260015195876773, 0.0789002279381516, 0.1183503419072274,
+               0.2816496580927726, 0.3333333333333333, 0.25, 0.3076923076923077,
+               0.6512820512820513, 0.6, 0.8571428571428571, 1.0])
+
+DOP_A = zeros((12, 12))
+DOP_A[1, 0] = 0.05260015195876773
+
+DOP_A[2, 0] = 0.0197250569845379
+DOP_A[2, 1] = 0.0591751709536137
+
+DOP_A[3, 0] = 0.02958758547680685
+DOP_A[3, 2] = 0.08876275643042054
+
+DOP_A[4, 0] = 0.2413651341592667
+DOP_A[4, 2] = -0.8845494793282861
+DOP_A[4, 3] = 0.924834003261792
+
+DOP_A[5, 0] = 0.037037037037037035
+DOP_A[5, 3] = 0.17082860872947386
+DOP_A[5, 4] = 0.12546768756682242
+
+DOP_A[6, 0] = 0.037109375
+DOP_A[6, 3] = 0.17025221101954405
+DOP_A[6, 4] = 0.06021653898045596
+DOP_A[6, 5] = -0.017578125
+
+DOP_A[7, 0] = 0.03709200011850479
+DOP_A[7, 3] = 0.17038392571223998
+DOP_A[7, 4] = 0.10726203044637328
+DOP_A[7, 5] = -0.015319437748624402
+DOP_A[7, 6] = 0.008273789163814023
+
+DOP_A[8, 0] = 0.6241109587160757
+DOP_A[8, 3] = -3.3608926294469414
+DOP_A[8, 4] = -0.868219346841726
+DOP_A[8, 5] = 27.59209969944671
+DOP_A[8, 6] = 20.154067550477894
+DOP_A[8, 7] = -43.48988418106996
+
+DOP_A[9, 0] = 0.47766253643826434
+DOP_A[9, 3] = -2.4881146199716677
+DOP_A[9, 4] = -0.590290826836843
+DOP_A[9, 5] = 21.230051448181193
+DOP_A[9, 6] = 15.279233632882423
+DOP_A[9, 7] = -33.28821096898486
+DOP_A[9, 8] = -0.020331201708508627
+
+DOP_A[10, 0] = -0.9371424300859873
+DOP_A[10, 3] = 5.186372428844064
+DOP_A[10, 4] = 1.0914373489967295
+DOP_A[10, 5] = -8.149787010746927
+DOP_A[10, 6] = -18.52006565999696
+DOP_A[10, 7] = 22.739487099350505
+DOP_A[10, 8] = 2.4936055526796523
+DOP_A[10, 9] = -3.0467644718982196
+
+DOP_A[11, 0] = 2.273310147516538
+DOP_A[11, 3] = -10.53449546673725
+DOP_A[11, 4] = -2.0008720582248625
+DOP_A[11, 5] = -17.9589318631188
+DOP_A[11, 6] = 27.94888452941996
+DOP_A[11, 7] = -2.8589982771350235
+DOP_A[11, 8] = -8.87285693353063
+DOP_A[11, 9] = 12.360567175794303
+DOP_A[11, 10] = 0.6433927460157636
+
+DOP_B = array([0.054293734116568765, 0.0, 0.0, 0.0,
+               0.0, 4.450312892752409, 1.8915178993145003, -5.801203960010585,
+               0.3111643669578199, -0.1521609496625161, 0.20136540080403034, 0.04471061572777259])
+DOP_E3 = array([-0.18980075407240762, 0.0, 0.0, 0.0,
+                0.0, 4.450312892752409, 1.8915178993145003, -5.801203960010585,
+                -0.4226823213237919, -0.1521609496625161, 0.20136540080403034, 0.02265179219836082])
+DOP_E5 = array([0.01312004499419488, 0.0, 0.0, 0.0,
+                0.0, -1.2251564463762044, -0.4957589496572502, 1.6643771824549864,
+                -0.35032884874997366, 0.3341791187130175, 0.08192320648511571, -0.022355307863886294])
+
+
+# Not cached on disk: f is typed by its address, which changes in every process
+@njit(error_model='numpy')
+def dop853_step(f, args, t, y, h, atol, rtol, K, y_new):
+    """
+    Single DOP853 step of y'(t) = f(y, t, *args), compiled with Numba.
+
+    Parameters
+    ----------
+    f : Numba-compiled callable
+        Right-hand side f(y, t, *args) returning a tuple with len(y) floats
+        (same argument order as scipy's odeint).
+    args : tuple
+        Extra parameters passed to f.
+    t, y : float, array
+        Current time and state.
+    h : float
+        Step size (negative for backward integration).
+    atol, rtol : float
+        Absolute and relative tolerances for the error estimate.
+    K : array with shape (13, len(y))
+        Work array; rows 0-11 store the stages and row 12 the stage states.
+    y_new : array
+        Output array for the 8th order solution.
+
+    Returns
+    -------
+    err : float
+        Norm of the scaled local error (same estimate as scipy's DOP853);
+        the step is accepted if err <= 1.
+    """
+    n = y.shape[0]
+    for i in range(12):
+        for m in range(n):
+            acc = 0.0
+            for j in range(i):
+                acc += DOP_A[i, j] * K[j, m]
+            K[12, m] = y[m] + h * acc
+        dy = f(K[12], t + DOP_C[i] * h, *args)
+        for m in range(n):
+            K[i, m] = dy[m]
+
+    err3 = 0.0
+    err5 = 0.0
+    for m in range(n):
+        acc = 0.0
+        e3 = 0.0
+        e5 = 0.0
+        for i in range(12):
+            acc += DOP_B[i] * K[i, m]
+            e3 += DOP_E3[i] * K[i, m]
+            e5 += DOP_E5[i] * K[i, m]
+        y_new[m] = y[m] + h * acc
+        sc = atol + rtol * max(abs(y[m]), abs(y_new[m]))
+        err3 += (e3 / sc) ** 2
+        err5 += (e5 / sc) ** 2
+    if err3 == 0. and err5 == 0.:
+        return 0.
+    return abs(h) * err5 / sqrt((err5 + 0.01 * err3) * n)
+
+
 # --------------------------- Small usage example ---------------------------
 if __name__ == "__main__":
     # Solve y' = -y, y(0)=1 on [0, 5]; exact y=exp(-t)
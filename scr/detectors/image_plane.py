@@ -7,7 +7,8 @@ curved spacetime
 ===============================================================================
 """
 
-from numpy import sqrt, sin, cos, arccos, arctan, linspace
+from numpy import sqrt, sin, cos, arccos, arctan, linspace, array, zeros_like, \
+                  column_stack, broadcast_arrays
 
 
 class detector:
@@ -59,20 +60,29 @@ class detector:
         and the initial components of the momentum (k_t, k_r, k_theta, k_phi)
         ===========================================================================
         '''
+        return list(self.photon_coords_batch(blackhole, array([alpha]), array([beta]), freq)[0])
+
+    def photon_coords_batch(self, blackhole, alpha, beta, freq=1): 
+        '''
+        ===========================================================================
+        Same as photon_coords, for the arrays alpha and beta of N photons.
+        Returns the initial conditions of all the photons with shape (N, 8)
+        ===========================================================================
+        '''
         # Transformation from (Alpha, Beta, D) to (r, theta, phi) 
         r = sqrt(alpha**2 + beta**2 + self.D**2)
         theta = arccos((beta*self.sin_iota + self.D*self.cos_iota)/r)
         phi = arctan(alpha/(self.D*self.sin_iota - beta*self.cos_iota))
 
-        # Initial position of the photon in spherical coordinates 
+        # Initial position of the photons in spherical coordinates 
         # (t=0, r, theta, phi)
-        xin = [0., r, theta, phi]
+        xin = [zeros_like(r), r, theta, phi]
 
-        # Metric components
+        # Metric components (evaluated element-wise on the arrays)
         g_tt, g_rr, g_thth, g_phph, g_tph = blackhole.metric(xin)
 
         # Given a frequency value w0=1, calculates the initial 
-        # 4-momentum of the photon  
+        # 4-momentum of the photons  
         #w0 =  freq    # Frequency of the photon at infinity
         k_th = sqrt(g_thth)*beta/self.D
         k_ph = - sqrt(g_phph)*alpha/(self.D)
@@ -82,7 +92,7 @@ class detector:
         # Initial 4-momentum in spherical coordinates (kt, kr, ktheta, kphi)
         k_in = [k_t, k_r, k_th, k_ph]
 
-        return xin + k_in 
+        return column_stack(broadcast_arrays(*xin, *k_in))
  
 
 